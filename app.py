@@ -1,8 +1,12 @@
 import os
+import re
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 from flask import Flask, request, render_template
 from twilio_service import send_whatsapp_message
-from metar_service import get_gatwick_metar, parse_metar_for_human
+from metar_service import get_gatwick_metar_human
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,32 +16,39 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
 
+# Background pool for fetching METARs and sending replies, so the webhook can
+# answer Twilio straight away. max_workers also caps concurrent upstream fetches.
+# When the process exits, concurrent.futures' own exit hook lets the pool run
+# any queued replies before the interpreter shuts down.
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Any message containing one of these keywords gets a METAR reply
+TRIGGER_RE = re.compile(r"metar|weather|gatwick", re.IGNORECASE)
+
+# Recently handled (MessageSid, From) pairs, so Twilio redeliveries within its
+# retry window don't trigger a second fetch and reply. This is per process, so
+# with several gunicorn workers a redelivery routed to a different worker
+# isn't caught.
+_RECENT = TTLCache(maxsize=1024, ttl=30)
+_RECENT_LOCK = threading.Lock()
+
 @app.route('/')
 def index():
     """Render the main page."""
     return render_template('index.html')
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
+def _handle(sender, incoming_msg):
     """
-    Webhook endpoint for incoming WhatsApp messages via Twilio.
+    Reply to an incoming WhatsApp message. Runs on the background executor.
     """
     try:
-        # Get the message body from the request
-        incoming_msg = request.values.get('Body', '').strip().lower()
-        # Get the sender's WhatsApp number
-        sender = request.values.get('From', '')
-        
-        logger.debug(f"Received message: '{incoming_msg}' from {sender}")
-        
         # Simple message parsing - any message containing 'metar' or specific keywords triggers a response
-        if 'metar' in incoming_msg or 'weather' in incoming_msg or 'gatwick' in incoming_msg:
+        if TRIGGER_RE.search(incoming_msg):
             # Fetch the latest METAR for Gatwick
             try:
-                metar_data = get_gatwick_metar()
-                if metar_data:
-                    # Parse the METAR into a more readable format
-                    human_readable = parse_metar_for_human(metar_data)
+                # Cached METARs come back already formatted
+                human_readable = get_gatwick_metar_human()
+                if human_readable:
                     # Send the formatted METAR response via WhatsApp
                     send_whatsapp_message(sender, human_readable)
                     logger.debug(f"Sent METAR response to {sender}")
@@ -56,6 +67,34 @@ def webhook():
                       "please send a message containing 'metar', 'weather', or 'gatwick'.")
             send_whatsapp_message(sender, help_msg)
             logger.debug(f"Sent help message to {sender}")
+    except Exception as e:
+        logger.error(f"Error handling message from {sender}: {str(e)}")
+
+@app.route('/webhook', methods=['POST'])
+def webhook():
+    """
+    Webhook endpoint for incoming WhatsApp messages via Twilio.
+    """
+    try:
+        # Get the message body from the request
+        incoming_msg = request.values.get('Body', '').strip()
+        # Get the sender's WhatsApp number
+        sender = request.values.get('From', '')
+        msg_sid = request.values.get('MessageSid')
+        
+        logger.debug(f"Received message: '{incoming_msg}' from {sender}")
+        
+        # Fetch and reply in the background so Twilio isn't kept waiting.
+        # Duplicate deliveries of a message we've already handled are ignored;
+        # a message is only marked as handled once it has been queued, so if
+        # submitting fails Twilio's retry still gets processed.
+        with _RECENT_LOCK:
+            if msg_sid and (msg_sid, sender) in _RECENT:
+                logger.debug(f"Ignoring duplicate message {msg_sid} from {sender}")
+                return '<Response></Response>'
+            EXECUTOR.submit(_handle, sender, incoming_msg)
+            if msg_sid:
+                _RECENT[(msg_sid, sender)] = True
         
         # Twilio expects a TwiML response
         return '<Response></Response>'
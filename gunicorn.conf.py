@@ -0,0 +1,26 @@
+import os
+
+# Gunicorn configuration, picked up automatically when running `gunicorn main:app`
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Each worker has its own METAR cache, single-flight lock, circuit breaker and
+# duplicate-message cache, so every worker fetches from the APIs once per cache
+# window. Keep the worker count small and use threads for concurrent webhooks.
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = 8
+timeout = 30
+
+# Replies run on a background executor, and a worker exiting on restart runs
+# any queued replies before it stops. A METAR fetch takes at most about
+# FETCH_BUDGET_SECONDS plus the connect timeout (~22 s), plus the Twilio send,
+# so give workers long enough to finish before being killed.
+graceful_timeout = 45
+
+# Import the app once in the master so module-level objects (the shared HTTP
+# session, Twilio client and executors) are built before forking rather than in
+# every worker. Caches and circuit breaker state start empty in each worker.
+# Nothing opens a socket or starts a thread at import time, so this is
+# fork-safe: each worker's connections and threads are created on first use.
+preload_app = True
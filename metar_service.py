@@ -1,7 +1,20 @@
 import os
+import functools
 import logging
+import random
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+# orjson decodes API responses considerably faster than the stdlib json module,
+# but it's optional - fall back to response.json() if it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -11,38 +24,314 @@ logger = logging.getLogger(__name__)
 CHECKWX_API_KEY = os.environ.get("CHECKWX_API_KEY")
 CHECKWX_API_URL = "https://api.checkwx.com/metar/EGKK/decoded"  # EGKK is Gatwick's ICAO code
 
+# Message layout shared by both API parsers
+_METAR_TEMPLATE = (
+    "🛫 *GATWICK AIRPORT (EGKK) METAR* 🛬\n\n"
+    "⏰ Observed: {time}\n\n"
+    "🌡️ Temperature: {temp_c}°C\n\n"
+    "💨 Wind: {wind_info}\n\n"
+    "👁️ Visibility: {visibility}\n\n"
+    "☁️ Clouds: {clouds}\n\n"
+    "📊 Raw METAR: {raw_metar}"
+)
+
+# Shared HTTP session so repeat lookups reuse pooled connections instead of
+# doing a fresh TCP + TLS handshake every time. It's used for both APIs, so the
+# CheckWX key is passed only on CheckWX requests rather than set on the session.
+SESSION = requests.Session()
+
+# No retries at the urllib3 level: all retrying happens in _get_with_retries so
+# it can add jitter, cap Retry-After and stay within FETCH_BUDGET_SECONDS
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
+
+# (connect, read) timeouts: fail fast on a dead host, but give a slow-but-working
+# API time to respond. Tune slightly above observed p95 latencies.
+_TIMEOUT = (2.0, 8.0)
+
+# Timeouts, connection errors and these status codes are retried with
+# exponential backoff plus jitter. Other 4xx errors aren't retried.
+RETRY_ATTEMPTS = 3
+RETRY_MAX_DELAY_SECONDS = 30
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# Total time allowed for one URL including retries. No new attempt is started
+# unless it can connect within the budget, so a fetch takes at most about
+# FETCH_BUDGET_SECONDS plus the connect timeout (~22 s).
+FETCH_BUDGET_SECONDS = 20
+
+# Circuit breaker for CheckWX: after enough consecutive failures, skip straight
+# to the fallback API for a cooldown period, then let a single probe through.
+CB_FAILURE_THRESHOLD = 5
+CB_COOLDOWN_SECONDS = 60
+_CB = {"failures": 0, "opened_at": 0.0, "probing": False}
+_CB_LOCK = threading.Lock()
+
+# Threads for querying the fallback API while CheckWX is queried on the calling
+# thread. Fallback calls finish within their time budget, so jobs can't pile
+# up behind a hung request.
+_FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+# METARs only update roughly every 30 minutes, so keep the last result for a
+# short while and serve it to every message that arrives in that window.
+# If both APIs are down, the cached METAR is still served until it's
+# STALE_MAX_SECONDS old, after which it's too old to pass off as the latest.
+CACHE_TTL_SECONDS = 60
+STALE_MAX_SECONDS = 2 * 60 * 60
+_CACHE = {"data": None, "expires": 0.0, "fetched_at": 0.0, "human": None, "human_source": None}
+_CACHE_LOCK = threading.Lock()
+
+# Single-flight state: when the cache expires, only one caller fetches from the
+# APIs and any others arriving meanwhile wait for its result. Each fetch gets
+# its own {"event", "result"} dict so a late waiter never sees another fetch's
+# result. Waiters allow a little longer than the fetch's own time budget.
+INFLIGHT_WAIT_SECONDS = FETCH_BUDGET_SECONDS + 5
+_INFLIGHT = {"flight": None}
+_INFLIGHT_LOCK = threading.Lock()
+
 def get_gatwick_metar():
     """
-    Fetch the latest METAR information for Gatwick Airport (EGKK).
+    Get the latest METAR information for Gatwick Airport (EGKK).
+    
+    Results are cached for CACHE_TTL_SECONDS, and concurrent cache misses share
+    a single upstream fetch. If both APIs fail, the last cached METAR is
+    returned (even if stale, up to STALE_MAX_SECONDS old) so users still get
+    a reply.
     
     Returns:
         dict: The METAR data as a dictionary or None if there was an error
     """
+    if time.monotonic() < _CACHE["expires"]:
+        return _CACHE["data"]
+    
+    with _INFLIGHT_LOCK:
+        flight = _INFLIGHT["flight"]
+        if flight is None:
+            # Another caller may have refreshed the cache while we waited for the lock
+            if time.monotonic() < _CACHE["expires"]:
+                return _CACHE["data"]
+            flight = _INFLIGHT["flight"] = {"event": threading.Event(), "result": None}
+            leader = True
+        else:
+            leader = False
+    
+    if not leader:
+        # Someone else is already fetching, so wait for their result
+        flight["event"].wait(timeout=INFLIGHT_WAIT_SECONDS)
+        if flight["result"]:
+            return flight["result"]
+        return _get_stale_metar()
+    
+    try:
+        metar_data = fetch_gatwick_metar()
+        
+        if metar_data:
+            with _CACHE_LOCK:
+                _CACHE["data"] = metar_data
+                _CACHE["fetched_at"] = time.monotonic()
+                _CACHE["expires"] = _CACHE["fetched_at"] + CACHE_TTL_SECONDS
+        else:
+            metar_data = _get_stale_metar()
+        
+        flight["result"] = metar_data
+        return metar_data
+    
+    finally:
+        with _INFLIGHT_LOCK:
+            flight["event"].set()
+            _INFLIGHT["flight"] = None
+
+def _get_stale_metar():
+    """Return the last cached METAR if it's within STALE_MAX_SECONDS, otherwise None."""
+    with _CACHE_LOCK:
+        metar_data = _CACHE["data"]
+        age = time.monotonic() - _CACHE["fetched_at"]
+    
+    if metar_data is None:
+        return None
+    if age > STALE_MAX_SECONDS:
+        logger.error(f"Cached METAR is {age / 60:.0f} minutes old, too stale to serve")
+        return None
+    
+    logger.warning("serving stale METAR")
+    return metar_data
+
+def _retry_after_seconds(response):
+    """Return the Retry-After header of a response in seconds, or None if absent or not numeric."""
     try:
-        # If no API key, try using a fallback free API
-        if not CHECKWX_API_KEY:
-            logger.warning("No CheckWX API key found. Using fallback AVIATIONWEATHER.GOV API.")
-            return get_gatwick_metar_fallback()
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+def _get_with_retries(url, headers=None):
+    """
+    GET a URL with the shared session, retrying timeouts, connection errors and
+    transient status codes with exponential backoff plus jitter, all within
+    FETCH_BUDGET_SECONDS.
+    
+    Args:
+        url (str): The URL to fetch
+        headers (dict): Extra headers to send with the request
+    
+    Returns:
+        requests.Response: The response from the last attempt
+    """
+    deadline = time.monotonic() + FETCH_BUDGET_SECONDS
+    for attempt in range(RETRY_ATTEMPTS):
+        remaining = deadline - time.monotonic()
+        timeout = (min(_TIMEOUT[0], remaining), min(_TIMEOUT[1], remaining))
+        error = None
+        response = None
+        try:
+            response = SESSION.get(url, headers=headers, timeout=timeout)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            failure = f"status code {response.status_code}"
+            delay = _retry_after_seconds(response)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            error = e
+            failure = str(e)
+            delay = None
         
-        headers = {"X-API-Key": CHECKWX_API_KEY}
-        response = requests.get(CHECKWX_API_URL, headers=headers, timeout=10)
+        if delay is None:
+            delay = 2 ** attempt * (1 + random.random() * 0.5)
+        delay = min(RETRY_MAX_DELAY_SECONDS, delay)
+        
+        # Give up on the last attempt, or if there's no time left for another one
+        if attempt == RETRY_ATTEMPTS - 1 or time.monotonic() + delay + _TIMEOUT[0] > deadline:
+            logger.warning(f"Request to {url} failed ({failure}), giving up")
+            if error is not None:
+                raise error
+            return response
+        
+        logger.warning(f"Request to {url} failed ({failure}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+def _circuit_allows_request():
+    """Return True if the CheckWX circuit is closed or ready for a half-open probe."""
+    with _CB_LOCK:
+        if _CB["failures"] < CB_FAILURE_THRESHOLD:
+            return True
+        if time.monotonic() - _CB["opened_at"] < CB_COOLDOWN_SECONDS:
+            return False
+        # Half-open: only one request gets to probe CheckWX
+        if _CB["probing"]:
+            return False
+        _CB["probing"] = True
+        return True
+
+def _record_circuit_success():
+    """Close the CheckWX circuit."""
+    with _CB_LOCK:
+        _CB["failures"] = 0
+        _CB["probing"] = False
+
+def _record_circuit_failure():
+    """Count a CheckWX failure, (re-)opening the circuit once over the threshold."""
+    with _CB_LOCK:
+        _CB["failures"] += 1
+        _CB["opened_at"] = time.monotonic()
+        _CB["probing"] = False
+        if _CB["failures"] >= CB_FAILURE_THRESHOLD:
+            logger.warning(f"CheckWX circuit open after {_CB['failures']} consecutive failures")
+
+def get_gatwick_metar_human():
+    """
+    Get the latest Gatwick METAR as a human-readable message.
+    
+    The formatted message is cached alongside the METAR it was built from, so
+    cache hits skip parsing entirely.
+    
+    Returns:
+        str: The formatted METAR message or None if there was an error
+    """
+    metar_data = get_gatwick_metar()
+    if not metar_data:
+        return None
+    
+    with _CACHE_LOCK:
+        if _CACHE["human_source"] is metar_data:
+            return _CACHE["human"]
+    
+    human_readable = parse_metar_for_human(metar_data)
+    with _CACHE_LOCK:
+        _CACHE["human"] = human_readable
+        _CACHE["human_source"] = metar_data
+    return human_readable
+
+def _decode_json(response):
+    """Decode a JSON response body, using orjson when it's available."""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+def fetch_gatwick_metar():
+    """
+    Fetch the latest METAR information for Gatwick Airport (EGKK) from the APIs.
+    
+    CheckWX and AVIATIONWEATHER.GOV are queried at the same time. The CheckWX
+    result is preferred, and AVIATIONWEATHER.GOV is only used if CheckWX fails,
+    so a failing primary doesn't add the fallback's latency on top.
+    
+    Returns:
+        dict: The METAR data as a dictionary or None if there was an error
+    """
+    # If no API key, try using a fallback free API
+    if not CHECKWX_API_KEY:
+        logger.warning("No CheckWX API key found. Using fallback AVIATIONWEATHER.GOV API.")
+        return get_gatwick_metar_fallback()
+    
+    if not _circuit_allows_request():
+        logger.debug("CheckWX circuit open. Using fallback AVIATIONWEATHER.GOV API.")
+        return get_gatwick_metar_fallback()
+    
+    # Start the fallback in the background and query CheckWX on this thread
+    try:
+        fallback = _FETCH_EXECUTOR.submit(get_gatwick_metar_fallback)
+    except RuntimeError:
+        # The interpreter is shutting down and won't start new threads, so
+        # query the APIs one after the other instead
+        fallback = None
+    
+    metar_data = get_gatwick_metar_checkwx()
+    if metar_data:
+        return metar_data
+    
+    logger.warning("CheckWX fetch failed. Using fallback AVIATIONWEATHER.GOV result.")
+    if fallback is None:
+        return get_gatwick_metar_fallback()
+    # The fallback is bounded by FETCH_BUDGET_SECONDS, so this wait ends too
+    return fallback.result()
+
+def get_gatwick_metar_checkwx():
+    """
+    Fetch METAR from the CheckWX API, updating the circuit breaker.
+    
+    Returns:
+        dict: The METAR data as a dictionary or None if there was an error
+    """
+    try:
+        response = _get_with_retries(CHECKWX_API_URL, headers={"X-API-Key": CHECKWX_API_KEY})
         
         if response.status_code == 200:
-            data = response.json()
+            data = _decode_json(response)
             if data.get("results", 0) > 0:
-                return data["data"][0]  # Return the first (latest) METAR
+                # Only a usable METAR counts as a success for the circuit breaker
+                metar_data = data["data"][0]  # Return the first (latest) METAR
+                _record_circuit_success()
+                return metar_data
             else:
                 logger.error("No METAR data found in API response")
+                _record_circuit_failure()
                 return None
         else:
             logger.error(f"API request failed with status code {response.status_code}: {response.text}")
-            # If primary API fails, try the fallback
-            return get_gatwick_metar_fallback()
+            _record_circuit_failure()
+            return None
     
     except Exception as e:
         logger.error(f"Error fetching METAR data: {str(e)}")
-        # If an exception occurs, try the fallback
-        return get_gatwick_metar_fallback()
+        _record_circuit_failure()
+        return None
 
 def get_gatwick_metar_fallback():
     """
@@ -53,10 +342,10 @@ def get_gatwick_metar_fallback():
     """
     try:
         url = "https://aviationweather.gov/api/data/metar?ids=EGKK&format=json"
-        response = requests.get(url, timeout=10)
+        response = _get_with_retries(url)
         
         if response.status_code == 200:
-            data = response.json()
+            data = _decode_json(response)
             if data and len(data) > 0:
                 return data[0]  # Return the first (latest) METAR
             else:
@@ -108,27 +397,25 @@ def parse_checkwx_metar(metar_data):
         time = metar_data.get("observed", "N/A")
         
         # Extract weather conditions
-        temp_c = metar_data.get("temperature", {}).get("celsius", "N/A")
-        wind_speed = metar_data.get("wind", {}).get("speed_kts", "N/A")
-        wind_direction = metar_data.get("wind", {}).get("degrees", "N/A")
-        wind_gust = metar_data.get("wind", {}).get("gust_kts", "")
-        visibility = metar_data.get("visibility", {}).get("meters", "N/A")
+        wind = metar_data.get("wind") or {}
+        temp = metar_data.get("temperature") or {}
+        vis = metar_data.get("visibility") or {}
+        temp_c = temp.get("celsius", "N/A")
+        wind_speed = wind.get("speed_kts", "N/A")
+        wind_direction = wind.get("degrees", "N/A")
+        wind_gust = wind.get("gust_kts", "")
+        visibility = vis.get("meters", "N/A")
         
         # Convert visibility to km for readability
         visibility_km = f"{float(visibility)/1000:.1f} km" if visibility != "N/A" else "N/A"
         
         # Extract cloud information
-        clouds = ""
-        if "clouds" in metar_data and metar_data["clouds"]:
-            cloud_layers = []
-            for cloud in metar_data["clouds"]:
-                code = cloud.get("code", "")
-                altitude = cloud.get("base_feet_agl", "")
-                if code and altitude:
-                    cloud_layers.append(f"{code} at {altitude} ft")
-            clouds = ", ".join(cloud_layers) if cloud_layers else "No cloud data"
-        else:
-            clouds = "No cloud data"
+        clouds = ", ".join(
+            f"{code} at {altitude} ft"
+            for cloud in (metar_data.get("clouds") or ())
+            for code, altitude in [(cloud.get("code", ""), cloud.get("base_feet_agl", ""))]
+            if code and altitude
+        ) or "No cloud data"
         
         # Format wind information
         wind_info = f"{wind_direction}° at {wind_speed} knots"
@@ -136,23 +423,32 @@ def parse_checkwx_metar(metar_data):
             wind_info += f", gusting to {wind_gust} knots"
         
         # Build the response
-        response = [
-            f"🛫 *GATWICK AIRPORT (EGKK) METAR* 🛬",
-            f"⏰ Observed: {time}",
-            f"🌡️ Temperature: {temp_c}°C",
-            f"💨 Wind: {wind_info}",
-            f"👁️ Visibility: {visibility_km}",
-            f"☁️ Clouds: {clouds}",
-            f"📊 Raw METAR: {raw_metar}"
-        ]
-        
-        return "\n\n".join(response)
+        return _METAR_TEMPLATE.format(
+            time=time,
+            temp_c=temp_c,
+            wind_info=wind_info,
+            visibility=visibility_km,
+            clouds=clouds,
+            raw_metar=raw_metar
+        )
     
     except Exception as e:
         logger.error(f"Error parsing CheckWX METAR: {str(e)}")
         # Return the raw METAR as a fallback
         return f"Gatwick METAR: {metar_data.get('raw', 'Data unavailable')}"
 
+@functools.lru_cache(maxsize=16)
+def _format_observation_time(observation_time):
+    """Format an ISO 8601 observation time string, e.g. 2024-01-01T12:20:00Z, for display."""
+    # Only reformat full UTC timestamps - anything else is shown unchanged
+    if not ("T" in observation_time and observation_time.endswith("Z")):
+        return observation_time
+    try:
+        time_obj = datetime.fromisoformat(observation_time.replace("Z", "+00:00"))
+        return time_obj.strftime("%d-%b-%Y %H:%M UTC")
+    except:
+        return observation_time
+
 def parse_aviationweather_metar(metar_data):
     """Parse METAR data from AVIATIONWEATHER.GOV API format."""
     try:
@@ -162,11 +458,10 @@ def parse_aviationweather_metar(metar_data):
         # Try to convert observation time
         obs_time = "N/A"
         if "observation_time" in metar_data:
-            try:
-                time_obj = datetime.strptime(metar_data["observation_time"], "%Y-%m-%dT%H:%M:%SZ")
-                obs_time = time_obj.strftime("%d-%b-%Y %H:%M UTC")
-            except:
-                obs_time = metar_data["observation_time"]
+            obs_time = metar_data["observation_time"]
+            # Check the type here - lru_cache can't hash lists or dicts
+            if isinstance(obs_time, str):
+                obs_time = _format_observation_time(obs_time)
         
         # Extract weather conditions
         temp_c = metar_data.get("temp_c", "N/A")
@@ -185,21 +480,16 @@ def parse_aviationweather_metar(metar_data):
                 visibility = f"{visibility_statute_mi} miles"
         
         # Extract cloud information
-        clouds = "No cloud data"
-        if "sky_condition" in metar_data:
-            if isinstance(metar_data["sky_condition"], list):
-                cloud_layers = []
-                for cloud in metar_data["sky_condition"]:
-                    code = cloud.get("sky_cover", "")
-                    altitude = cloud.get("cloud_base_ft_agl", "")
-                    if code and altitude:
-                        cloud_layers.append(f"{code} at {altitude} ft")
-                clouds = ", ".join(cloud_layers) if cloud_layers else "No cloud data"
-            elif isinstance(metar_data["sky_condition"], dict):
-                code = metar_data["sky_condition"].get("sky_cover", "")
-                altitude = metar_data["sky_condition"].get("cloud_base_ft_agl", "")
-                if code and altitude:
-                    clouds = f"{code} at {altitude} ft"
+        # sky_condition may be a single layer dict or a list of layers
+        sky_condition = metar_data.get("sky_condition") or []
+        layers = sky_condition if isinstance(sky_condition, list) else [sky_condition]
+        clouds = ", ".join(
+            f"{code} at {altitude} ft"
+            for cloud in layers
+            if isinstance(cloud, dict)
+            for code, altitude in [(cloud.get("sky_cover", ""), cloud.get("cloud_base_ft_agl", ""))]
+            if code and altitude
+        ) or "No cloud data"
         
         # Format wind information
         wind_info = f"{wind_direction}° at {wind_speed} knots"
@@ -207,17 +497,14 @@ def parse_aviationweather_metar(metar_data):
             wind_info += f", gusting to {wind_gust} knots"
         
         # Build the response
-        response = [
-            f"🛫 *GATWICK AIRPORT (EGKK) METAR* 🛬",
-            f"⏰ Observed: {obs_time}",
-            f"🌡️ Temperature: {temp_c}°C",
-            f"💨 Wind: {wind_info}",
-            f"👁️ Visibility: {visibility}",
-            f"☁️ Clouds: {clouds}",
-            f"📊 Raw METAR: {raw_metar}"
-        ]
-        
-        return "\n\n".join(response)
+        return _METAR_TEMPLATE.format(
+            time=obs_time,
+            temp_c=temp_c,
+            wind_info=wind_info,
+            visibility=visibility,
+            clouds=clouds,
+            raw_metar=raw_metar
+        )
     
     except Exception as e:
         logger.error(f"Error parsing AVIATIONWEATHER METAR: {str(e)}")
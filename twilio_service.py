@@ -10,6 +10,15 @@ TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_NUMBER = os.environ.get("TWILIO_WHATSAPP_NUMBER")  # Should be in format "whatsapp:+1234567890"
 
+# Shared Twilio client so its connection pool to api.twilio.com is reused
+# across messages instead of being rebuilt (with a new TLS handshake) each time
+_CLIENT = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN]) else None
+
+# The from number never changes, so normalize it to the "whatsapp:" format once
+_FROM_NUMBER = None
+if TWILIO_WHATSAPP_NUMBER:
+    _FROM_NUMBER = TWILIO_WHATSAPP_NUMBER if TWILIO_WHATSAPP_NUMBER.startswith("whatsapp:") else f"whatsapp:{TWILIO_WHATSAPP_NUMBER}"
+
 def send_whatsapp_message(to_number, message_body):
     """
     Send a WhatsApp message via Twilio.
@@ -23,27 +32,21 @@ def send_whatsapp_message(to_number, message_body):
     """
     try:
         # Check if we have the required Twilio credentials
-        if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_NUMBER]):
+        if _CLIENT is None or not _FROM_NUMBER:
             logger.error("Missing Twilio credentials. Cannot send WhatsApp message.")
             return False
         
-        # Initialize the Twilio client
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        client = _CLIENT
         
         # Ensure the recipient number is in the correct format
         # If it doesn't already start with "whatsapp:", add it
         if not to_number.startswith("whatsapp:"):
             to_number = f"whatsapp:{to_number}"
         
-        # Ensure the from number is in the correct format
-        from_number = TWILIO_WHATSAPP_NUMBER
-        if not from_number.startswith("whatsapp:"):
-            from_number = f"whatsapp:{from_number}"
-        
         # Send the message
         message = client.messages.create(
             body=message_body,
-            from_=from_number,
+            from_=_FROM_NUMBER,
             to=to_number
         )
         